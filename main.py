@@ -9,15 +9,16 @@ import argparse
 from rich.console import Console
 from rich.panel import Panel
 from rich.markdown import Markdown
-from src.agent import run_agent
 from src.memory import ShortTermMemory
 from src.long_term_memory import LongTermMemory
 from src.safety import CircuitBreaker
+from src.llm_cache import LLMCache
 from src.config import (
     MAX_ITERATIONS, 
     SHORT_TERM_MEMORY_SIZE,
     MAX_CONSECUTIVE_FAILURES,
-    MAX_API_REQUESTS
+    MAX_API_REQUESTS,
+    LLM_CACHE_ENABLED
 )
 
 console = Console()
@@ -51,9 +52,10 @@ def show_stats():
     console.print()
 
 
-def run_demo():
+def run_demo(use_cache: bool = LLM_CACHE_ENABLED):
     """Run a demo with a pre-built example"""
     console.print("\n[bold green]🎬 Running Demo Mode[/bold green]\n")
+    from src.agent import run_agent
     
     demo_goals = [
         "write a function that calculates factorial of a number with tests",
@@ -75,13 +77,13 @@ def run_demo():
         if 0 <= idx < len(demo_goals):
             goal = demo_goals[idx]
             console.print(f"\n[dim]Selected: {goal}[/dim]\n")
-            run_agent(goal)
+            run_agent(goal, use_cache)
         else:
             console.print("[red]Invalid choice. Using demo #1[/red]")
-            run_agent(demo_goals[0])
+            run_agent(demo_goals[0], use_cache)
     except ValueError:
         console.print("[red]Invalid input. Using demo #1[/red]")
-        run_agent(demo_goals[0])
+        run_agent(demo_goals[0], use_cache)
 
 
 def clear_memory():
@@ -97,11 +99,38 @@ def clear_memory():
     
     if confirm == "yes":
         ltm.clear()
+        clear_cache()
         console.print("\n[green]✅ Memory cleared successfully.[/green]")
     else:
         console.print("\n[dim]Cancelled.[/dim]")
 
 
+def clear_cache():
+    """Clear the Claude response cache"""
+    llm_cache = LLMCache()
+    count = llm_cache.count()
+    llm_cache.clear()
+    llm_cache.close()
+    console.print(f"\n[green]✅ Cleared {count} cached response(s).[/green]")
+
+
+def run_batch(source: str):
+    """Run every goal in a file (or stdin for '-') as one non-interactive batch"""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source) as f:
+            lines = f.read().splitlines()
+    
+    goals = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+    if not goals:
+        console.print("\n[red]No goals found for batch run.[/red]")
+        return
+    
+    from src.agent import run_agent_batch
+    run_agent_batch(goals)
+
+
 def show_examples():
     """Show example usage"""
     examples = """
@@ -144,6 +173,9 @@ Examples:
   python3 main.py --stats
   python3 main.py --examples
   python3 main.py --clear-memory
+  python3 main.py --cache "write a factorial function with tests"
+  python3 main.py --clear-cache
+  python3 main.py --batch goals.txt
 
 For more information: https://github.com/yourusername/coding-agent
         """
@@ -176,7 +208,26 @@ For more information: https://github.com/yourusername/coding-agent
     parser.add_argument(
         '--clear-memory',
         action='store_true',
-        help='Clear long-term memory'
+        help='Clear long-term memory and the response cache'
+    )
+    
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        default=LLM_CACHE_ENABLED,
+        help='Replay successful Claude responses from the on-disk cache'
+    )
+    
+    parser.add_argument(
+        '--clear-cache',
+        action='store_true',
+        help='Clear the Claude response cache'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        help="Run every goal in FILE (one per line, '-' for stdin) via the Message Batches API"
     )
     
     parser.add_argument(
@@ -204,14 +255,28 @@ For more information: https://github.com/yourusername/coding-agent
         clear_memory()
         return
     
+    if args.clear_cache:
+        clear_cache()
+        return
+    
     if args.demo:
-        run_demo()
+        run_demo(args.cache)
         return
     
-    # Interactive or direct mode
+    if args.batch:
+        run_batch(args.batch)
+        return
+    
+    # The agent pulls in the Anthropic SDK and Rich syntax support, so only import it once we need it
+    from src.agent import run_agent
+
+    # Interactive, direct or batch mode
     if args.goal:
         # Direct mode - goal provided as argument
-        run_agent(args.goal)
+        run_agent(args.goal, args.cache)
+    elif not sys.stdin.isatty():
+        # Goals piped in (e.g. from CI) - run them all as one batch
+        run_batch('-')
     else:
         # Interactive mode - prompt for goal
         console.print("[bold]Enter your coding goal:[/bold]")
@@ -225,7 +290,7 @@ For more information: https://github.com/yourusername/coding-agent
             return
         
         console.print()  # Blank line for spacing
-        run_agent(goal)
+        run_agent(goal, args.cache)
 
 
 if __name__ == "__main__":
@@ -1,32 +1,383 @@
-import anthropic
+import asyncio
+import hashlib
 import json
 import re
-import os
+import atexit
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import List, Optional
 from rich.console import Console
 from rich.panel import Panel
-from rich.syntax import Syntax
-from src.config import ANTHROPIC_API_KEY, MODEL, MAX_ITERATIONS, MAX_TOKENS
-from src.executor import execute_code, is_code_safe, ExecutionResult
-from src.test_runner import run_tests, TestResult
+from src.config import (
+    ANTHROPIC_API_KEY, MODEL, MAX_ITERATIONS, MAX_TOKENS, LLM_CACHE_ENABLED, STOP_STREAM_AFTER_CODE,
+    CANDIDATES_PER_ITERATION, CANDIDATE_TEMPERATURES, BATCH_POLL_SECONDS, PROMPT_TOKEN_BUDGET, LOGS_DIR
+)
+from src.executor import execute_code_async, is_code_safe, ExecutionResult
 from src.memory import ShortTermMemory, Attempt, build_reflection_prompt
 from src.long_term_memory import LongTermMemory, Solution, build_retrieval_context
 from src.safety import CircuitBreaker, RateLimiter, AdvancedSafetyChecker
+from src.llm_cache import LLMCache
+
+try:
+    import orjson  # Optional: faster attempt logging
+except ImportError:
+    orjson = None
 
 console = Console()
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+# Syntax highlighting and panels only pay off on a real terminal; piped/CI runs get plain text
+_TTY = console.is_terminal
+
+
+# Anthropic clients by event loop. A client's connections belong to the loop that
+# opened them, and every run_agent/run_agent_batch call runs its own loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Anthropic client for the running event loop, created (and the SDK imported) on first use"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        import anthropic
+        client = _clients[loop] = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+    return client
+
+
+async def closing_client(coro):
+    """Await coro, then close the running loop's client before the loop shuts down"""
+    try:
+        return await coro
+    finally:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+
+# Attempt logs are written off the main thread so the next API call isn't held up
+log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="attempt-log")
+atexit.register(log_executor.shutdown, wait=True)
+
+
+def submit_log(*args):
+    """Queue log_attempt on the log thread, reporting any failure instead of dropping it"""
+    log_executor.submit(log_attempt, *args).add_done_callback(report_log_error)
+
+
+def report_log_error(future):
+    """Done-callback for submit_log - the future is otherwise never looked at"""
+    error = future.exception()
+    if error is not None:
+        console.print(f"[yellow]⚠️  Could not write attempt log: {error}[/yellow]")
+
+# Marks a content block as a prompt-cache breakpoint for the Anthropic API
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Compiled once at import - this runs on every iteration
+_CODE_RE = re.compile(r"```python\n(.*?)```", re.DOTALL)
 
 
 def extract_code(text: str):
     """Pull Python code out of the model's markdown response."""
-    pattern = r"```python\n(.*?)```"
-    matches = re.findall(pattern, text, re.DOTALL)
-    return matches[0].strip() if matches else None
+    match = _CODE_RE.search(text)
+    return match.group(1).strip() if match else None
+
+
+@dataclass
+class Candidate:
+    """One of the responses generated in parallel for an iteration, and what became of it"""
+    index: int
+    response: str
+    code: Optional[str] = None
+    blocked_by: Optional[str] = None  # APIError, NoCodeReturned, SafetyBlock or AdvancedSafetyBlock
+    block_message: str = ""
+    warnings: List[str] = field(default_factory=list)
+    result: Optional[ExecutionResult] = None
+    from_cache: bool = False
+    api_error: Optional[Exception] = field(default=None, repr=False)  # Set when blocked_by is APIError
+
+
+async def stream_response(system: list, messages: list, temperature: float = 1.0) -> tuple:
+    """
+    Stream Claude's reply and return (text, usage).
+
+    With STOP_STREAM_AFTER_CODE the stream is closed as soon as a complete
+    python block has arrived, so we don't wait for (or pay for) any text
+    the model writes after the code.
+    """
+    parts = []
+    async with get_client().messages.stream(
+        model=MODEL,
+        max_tokens=MAX_TOKENS,
+        system=system,
+        messages=messages,
+        temperature=temperature
+    ) as stream:
+        async for text in stream.text_stream:
+            parts.append(text)
+            # Only re-check when a chunk could have completed the closing fence
+            if STOP_STREAM_AFTER_CODE and "`" in text and _CODE_RE.search("".join(parts)):
+                break
+        usage = stream.current_message_snapshot.usage
+
+    return "".join(parts), usage.model_dump() if usage else {}
+
+
+async def run_candidate(index: int, system: list, messages: list, llm_cache: Optional[LLMCache]) -> Candidate:
+    """Get one response from Claude, then safety-check and execute its code."""
+    temperature = CANDIDATE_TEMPERATURES[index % len(CANDIDATE_TEMPERATURES)]
+
+    cache_key = None
+    if llm_cache is not None:
+        cache_key = LLMCache.make_key(MODEL, system, messages, temperature=temperature, candidate=index)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return await evaluate_response(Candidate(index=index, response=cached.text, from_cache=True))
+
+    try:
+        response, usage = await stream_response(system, messages, temperature)
+    except Exception as e:
+        # An overloaded or failed request sinks this candidate only, not the whole iteration
+        return Candidate(index=index, response="", blocked_by="APIError", block_message=str(e), api_error=e)
+    candidate = await evaluate_response(Candidate(index=index, response=response))
+
+    # Only keep responses whose code passed, so a retry never replays a failure
+    if cache_key is not None and candidate.result is not None and candidate.result.success:
+        llm_cache.put(cache_key, response, usage)
+    return candidate
+
+
+async def evaluate_response(candidate: Candidate) -> Candidate:
+    """Extract, safety-check and execute the code in a candidate's response."""
+    candidate.code = extract_code(candidate.response)
+    if not candidate.code:
+        candidate.blocked_by = "NoCodeReturned"
+        candidate.block_message = "No code block returned by Claude"
+        return candidate
+
+    # Basic safety check
+    is_safe, safety_message = is_code_safe(candidate.code)
+    if not is_safe:
+        candidate.blocked_by = "SafetyBlock"
+        candidate.block_message = safety_message
+        return candidate
+
+    # Advanced safety check
+    is_safe_advanced, warnings = AdvancedSafetyChecker.check_all(candidate.code)
+    if not is_safe_advanced:
+        candidate.blocked_by = "AdvancedSafetyBlock"
+        candidate.block_message = "; ".join(warnings)
+        candidate.warnings = warnings
+        return candidate
+
+    candidate.result = await execute_code_async(candidate.code)
+    return candidate
+
+
+async def run_candidates(system: list, messages: list, llm_cache: Optional[LLMCache]) -> List[Candidate]:
+    """
+    Run CANDIDATES_PER_ITERATION candidates concurrently and return them in
+    completion order, stopping early as soon as one of them succeeds.
+    Raises the API error only if every candidate's request failed.
+    """
+    tasks = [
+        asyncio.create_task(run_candidate(i, system, messages, llm_cache))
+        for i in range(CANDIDATES_PER_ITERATION)
+    ]
+    candidates = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            candidate = await next_done
+            candidates.append(candidate)
+            if candidate.result and candidate.result.success:
+                break
+    finally:
+        # Stop the stragglers - we already have a winner (or an error to report)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if all(candidate.api_error is not None for candidate in candidates):
+        raise candidates[0].api_error
+    return candidates
+
+
+def candidate_rank(candidate: Candidate) -> tuple:
+    """Sort key for picking the candidate to keep: success first, then most tests passed."""
+    result = candidate.result
+    if result is None:
+        # A blocked response still goes into memory for reflection; a failed request has nothing to show
+        return (False, -2 if candidate.api_error is not None else -1)
+    return (result.success, result.test_results['passed'] if result.test_results else 0)
+
+
+def candidate_status(candidate: Candidate) -> str:
+    """One-line description of how a candidate fared"""
+    if candidate.blocked_by:
+        return f"{candidate.blocked_by}: {candidate.block_message[:80]}"
+    if candidate.result.success:
+        return "✅ succeeded"
+    first_line = candidate.result.error.split('\n')[0]
+    return f"❌ {first_line[:80]}"
+
+
+async def wait_for_batch(batch_id: str):
+    """Poll a message batch until Anthropic has finished processing it."""
+    batch = await get_client().messages.batches.retrieve(batch_id)
+    while batch.processing_status != "ended":
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await get_client().messages.batches.retrieve(batch_id)
+    return batch
+
+
+async def request_batch(prompts: dict) -> dict:
+    """
+    Send one Message Batch with a single-turn request per custom_id in prompts,
+    wait for it to finish and return {custom_id: response_text} for the requests
+    that succeeded. Batches cost about half as much as interactive calls.
+    """
+    batch = await get_client().messages.batches.create(requests=[
+        {
+            "custom_id": custom_id,
+            "params": {
+                "model": MODEL,
+                "max_tokens": MAX_TOKENS,
+                "system": _SYSTEM_BLOCKS,
+                "messages": [{"role": "user", "content": content}],
+            },
+        }
+        for custom_id, content in prompts.items()
+    ])
+    console.print(f"[dim]Submitted batch {batch.id} with {len(prompts)} request(s), waiting for results...[/dim]")
+    await wait_for_batch(batch.id)
+
+    responses = {}
+    async for entry in await get_client().messages.batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            responses[entry.custom_id] = entry.result.message.content[0].text
+        else:
+            console.print(f"[red]Batch request {entry.custom_id} {entry.result.type}[/red]")
+    return responses
+
+
+def run_agent_batch(goals: List[str]) -> dict:
+    """
+    Non-interactive agent for a list of goals, using the Message Batches API.
+    Returns {goal: achieved}.
+    """
+    return asyncio.run(closing_client(run_agent_batch_async(goals)))
+
+
+async def run_agent_batch_async(goals: List[str]) -> dict:
+    """
+    Each round sends one batch covering every unsolved goal, then executes the
+    returned code for all goals concurrently. Failed goals get a reflection
+    prompt in the next round, up to MAX_ITERATIONS rounds.
+    """
+    console.print(Panel(f"[bold green]BATCH:[/bold green] {len(goals)} goal(s)", title="Coding Agent Starting"))
+
+    long_term_memory = LongTermMemory()
+    memories = {goal: ShortTermMemory(max_size=5) for goal in goals}
+    headers = {
+        goal: build_goal_header(goal, long_term_memory.find_similar(goal, top_k=2, min_similarity=0.3))
+        for goal in goals
+    }
+    custom_ids = {f"goal-{i}": goal for i, goal in enumerate(goals)}
+    solved = {goal: False for goal in goals}
+
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        pending = [custom_id for custom_id, goal in custom_ids.items() if not solved[goal]]
+        if not pending:
+            break
+        console.print(f"\n[bold yellow]--- Batch round {iteration}/{MAX_ITERATIONS}: {len(pending)} goal(s) ---[/bold yellow]")
+
+        responses = await request_batch({
+            custom_id: build_user_prompt(headers[custom_ids[custom_id]], memories[custom_ids[custom_id]])
+            for custom_id in pending
+        })
+
+        answered = [custom_id for custom_id in pending if custom_id in responses]
+        candidates = await asyncio.gather(*[
+            evaluate_response(Candidate(index=i, response=responses[custom_id]))
+            for i, custom_id in enumerate(answered)
+        ])
+
+        for custom_id, candidate in zip(answered, candidates):
+            goal = custom_ids[custom_id]
+            result = candidate.result
+            if result is None:
+                memories[goal].add(Attempt(
+                    iteration=iteration,
+                    code=candidate.code or "",
+                    success=False,
+                    output="",
+                    error=candidate.block_message
+                ))
+                console.print(f"  [red]❌[/red] {goal}: {candidate.blocked_by}")
+                continue
+
+            test_results = result.test_results
+
+            memories[goal].add(Attempt(
+                iteration=iteration,
+                code=candidate.code,
+                success=result.success,
+                output=result.output,
+                error=result.error,
+                test_results=test_results
+            ))
+            submit_log(goal, iteration, candidate.code, result, custom_id)
+
+            if result.success:
+                solved[goal] = True
+                if test_results:
+                    long_term_memory.add(Solution(
+                        goal=goal,
+                        code=candidate.code,
+                        test_results=test_results,
+                        timestamp=datetime.now().isoformat(),
+                        keywords=[],
+                        iterations_to_solve=iteration
+                    ))
+                console.print(f"  [green]✅[/green] {goal}")
+            else:
+                first_line = result.error.split('\n')[0]
+                console.print(f"  [red]❌[/red] {goal}: {first_line[:80]}")
+
+    achieved = sum(solved.values())
+    console.print(f"\n[bold]Batch finished: {achieved}/{len(goals)} goal(s) achieved[/bold]")
+    return solved
+
+
+def show_code(code: str, title: str):
+    """Print a code block - highlighted in a panel on a terminal, plain otherwise"""
+    if _TTY:
+        from rich.syntax import Syntax  # Pulls in Pygments, so only on a terminal
+        console.print(Panel(Syntax(code, "python", theme="monokai"), title=title))
+    else:
+        console.print(f"--- {title} ---\n{code}\n---", markup=False, highlight=False)
 
 
-def log_attempt(goal: str, iteration: int, code: str, result: ExecutionResult):
-    """Save each attempt to a log file for later review."""
-    log_path = os.path.join("logs", f"attempt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+def show_result(status: str, color: str, body: str, execution_time: float):
+    """Print an execution result - as a panel on a terminal, plain otherwise"""
+    if _TTY:
+        console.print(Panel(
+            f"[bold {color}]{status}[/bold {color}]\n{body}\nTime: {execution_time:.2f}s",
+            title="Result"
+        ))
+    else:
+        console.print(f"--- Result: {status} ---\n{body}\nTime: {execution_time:.2f}s", markup=False, highlight=False)
+
+
+def log_attempt(goal: str, iteration: int, code: str, result: ExecutionResult, label: str = ""):
+    """
+    Save each attempt to a log file for later review.
+    label (the batch custom_id) and the microseconds keep attempts logged in
+    the same second from overwriting each other.
+    """
+    suffix = f"_{label}" if label else ""
+    log_path = LOGS_DIR / f"attempt_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{suffix}.json"
     log_data = {
         "goal": goal,
         "iteration": iteration,
@@ -37,12 +388,17 @@ def log_attempt(goal: str, iteration: int, code: str, result: ExecutionResult):
         "execution_time": result.execution_time,
         "timestamp": datetime.now().isoformat()
     }
-    with open(log_path, "w") as f:
-        json.dump(log_data, f, indent=2)
+    if orjson is not None:
+        # C serializer, and the bytes go straight to disk without re-encoding
+        with open(log_path, "wb") as f:
+            f.write(orjson.dumps(log_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(log_path, "w") as f:
+            json.dump(log_data, f, indent=2)
 
 
-def build_system_prompt() -> str:
-    return """You are an expert Python coding agent. Your job is to write correct, working Python code to achieve a given goal.
+# Fixed for the whole process, so build it (and its cached API block) once at import
+_SYSTEM_PROMPT = """You are an expert Python coding agent. Your job is to write correct, working Python code to achieve a given goal.
 
 Rules you must follow:
 1. Always write code WITH unit tests using Python's unittest framework
@@ -78,67 +434,180 @@ When you respond, always:
 - Then provide the complete code block
 """
 
+_SYSTEM_BLOCKS = [{"type": "text", "text": _SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}]
 
-def build_user_prompt(goal: str, memory: ShortTermMemory, long_term_memory: LongTermMemory) -> str:
-    """Build the prompt including reflection, history, and similar past solutions."""
-    prompt = f"Goal: {goal}\n\n"
 
-    # Check for similar past solutions
-    similar = long_term_memory.find_similar(goal, top_k=2, min_similarity=0.3)
+def build_system_prompt() -> str:
+    return _SYSTEM_PROMPT
+
+
+def build_goal_header(goal: str, similar: list) -> str:
+    """Build the stable part of the prompt: the goal plus any similar past solutions."""
+    header = f"Goal: {goal}\n\n"
     if similar:
-        prompt += build_retrieval_context(similar)
+        header += build_retrieval_context(similar)
+    return header
 
-    if memory.count() == 0:
-        prompt += "This is your first attempt. Write code with tests to achieve the goal."
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for keeping prompts in budget."""
+    return len(text) // 4
+
+
+def code_fingerprint(code: str) -> str:
+    """Short, stable hash identifying a piece of code."""
+    return hashlib.blake2b(code.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def format_attempt(attempt: Attempt, repeat_of: Optional[Attempt] = None, code_limit: Optional[int] = None) -> str:
+    """
+    Full details of an attempt: its code and exactly how it failed.
+    code_limit cuts the middle out of longer code, keeping the fence intact.
+    """
+    text = f"--- Attempt {attempt.iteration} ---\n"
+    if repeat_of is not None:
+        text += f"⚠️ This code is identical to attempt {repeat_of.iteration}{same_result_note(attempt, repeat_of)} - try a different approach.\n"
+    code = attempt.code
+    if code_limit is not None and len(code) > code_limit:
+        head = code_limit // 2
+        code = code[:head] + _CODE_CUT + code[len(code) - (code_limit - head):]
+    text += f"Code:\n```python\n{code}\n```\n"
+    
+    if attempt.success:
+        text += f"Result: ✅ SUCCESS\n"
+        if attempt.test_results:
+            text += f"All {attempt.test_results['total_tests']} tests passed!\n"
+        text += f"Output: {attempt.output}\n\n"
     else:
-        # Add reflection prompt
-        prompt += build_reflection_prompt(memory)
+        text += f"Result: ❌ FAILED\n"
         
-        # Add detailed history
-        prompt += "\n## Previous Attempts History\n\n"
-        for attempt in memory.get_all():
-            prompt += f"--- Attempt {attempt.iteration} ---\n"
-            prompt += f"Code:\n```python\n{attempt.code}\n```\n"
-            
-            if attempt.success:
-                prompt += f"Result: ✅ SUCCESS\n"
-                if attempt.test_results:
-                    prompt += f"All {attempt.test_results['total_tests']} tests passed!\n"
-                prompt += f"Output: {attempt.output}\n\n"
-            else:
-                prompt += f"Result: ❌ FAILED\n"
-                
-                if attempt.test_results:
-                    prompt += f"Tests: {attempt.test_results['passed']}/{attempt.test_results['total_tests']} passed\n"
-                    if attempt.test_results['failures']:
-                        prompt += "Failed tests:\n"
-                        for failure in attempt.test_results['failures']:
-                            prompt += f"  - {failure['test_name']}: {failure['message']}\n"
-                
-                prompt += f"Error: {attempt.error}\n\n"
+        if attempt.test_results:
+            text += f"Tests: {attempt.test_results['passed']}/{attempt.test_results['total_tests']} passed\n"
+            if attempt.test_results['failures']:
+                text += "Failed tests:\n"
+                for failure in attempt.test_results['failures']:
+                    text += f"  - {failure['test_name']}: {failure['message']}\n"
         
-        prompt += "Analyze the failures above and write corrected code with tests."
+        text += f"Error: {attempt.error}\n\n"
+    
+    return text
+
+
+_CODE_CUT = "\n# ... (truncated) ...\n"
+
+
+def same_result_note(attempt: Attempt, earlier: Attempt) -> str:
+    """', same result' when an attempt ended exactly like an earlier one"""
+    if attempt.success == earlier.success and attempt.error == earlier.error:
+        return ", same result"
+    return ""
+
 
-    return prompt
+def summarize_attempt(attempt: Attempt, repeat_of: Optional[Attempt] = None) -> str:
+    """One-line summary of an older attempt - the latest one carries the detail."""
+    status = "✅ SUCCESS" if attempt.success else "❌ FAILED"
+    if repeat_of is not None:
+        note = same_result_note(attempt, repeat_of)
+        summary = f"--- Attempt {attempt.iteration} --- {status} (identical to attempt {repeat_of.iteration}{note})"
+        if note:
+            return summary + "\n"
+    else:
+        summary = f"--- Attempt {attempt.iteration} --- {status} (code {code_fingerprint(attempt.code)})"
+    if not attempt.success and attempt.error:
+        summary += f": {attempt.error_first_line[:200]}"
+    return summary + "\n"
+
+
+def find_repeats(attempts: List[Attempt]) -> List[Optional[Attempt]]:
+    """For each attempt, the first earlier attempt with identical code (or None)"""
+    first_seen = {}
+    repeats = []
+    for attempt in attempts:
+        fingerprint = code_fingerprint(attempt.code)
+        repeats.append(first_seen.get(fingerprint))
+        first_seen.setdefault(fingerprint, attempt)
+    return repeats
 
 
-def run_agent(goal: str):
+def build_user_prompt(goal_header: str, memory: ShortTermMemory) -> list:
+    """
+    Build the user turn as content blocks, including reflection and history.
+
+    The goal header never changes within a run, so it is its own block and
+    marked for prompt caching. Only the latest attempt is shown in full; older
+    ones are one-line summaries, dropped oldest-first if the prompt would go
+    over PROMPT_TOKEN_BUDGET. Attempts that repeat earlier code point back to
+    the first one instead of describing it again.
+    """
+    if memory.count() == 0:
+        prompt = "This is your first attempt. Write code with tests to achieve the goal."
+    else:
+        attempts = memory.get_all()
+        reflection = build_reflection_prompt(memory)
+        # Regenerated code is referenced by attempt number instead of repeated
+        repeats = find_repeats(attempts)
+        latest = format_attempt(attempts[-1], repeats[-1])
+        older = [summarize_attempt(attempt, repeat_of) for attempt, repeat_of in zip(attempts[:-1], repeats)]
+        closing = "Analyze the failures above and write corrected code with tests."
+        budget = PROMPT_TOKEN_BUDGET - estimate_tokens(goal_header)
+
+        def assemble() -> str:
+            history = "\n## Previous Attempts History\n\n"
+            if older:
+                history += "Earlier attempts (summarized):\n" + "".join(older) + "\n"
+            return reflection + history + latest + closing
+
+        prompt = assemble()
+        while older and estimate_tokens(prompt) > budget:
+            older.pop(0)
+            prompt = assemble()
+
+        # Still too big - the latest attempt itself is huge. Cut the middle of
+        # its code first so the result and error lines survive
+        overflow = (estimate_tokens(prompt) - budget) * 4
+        if overflow > 0:
+            code_limit = max(0, len(attempts[-1].code) - overflow - len(_CODE_CUT))
+            latest = format_attempt(attempts[-1], repeats[-1], code_limit)
+            prompt = assemble()
+
+            # Even the result alone is over budget - trim the end of the error text
+            overflow = (estimate_tokens(prompt) - budget) * 4
+            if overflow > 0:
+                cut = "\n... (truncated)\n\n"
+                latest = latest[:max(0, len(latest) - overflow - len(cut))] + cut
+                prompt = assemble()
+
+    return [
+        {"type": "text", "text": goal_header, "cache_control": CACHE_CONTROL},
+        {"type": "text", "text": prompt},
+    ]
+
+
+def run_agent(goal: str, use_cache: bool = LLM_CACHE_ENABLED):
     """
     The main agent loop with safety, memory, and reflection.
     Plan → Execute → Test → Reflect → Learn → Repeat until success or max iterations.
+    use_cache replays successful responses from the on-disk response cache.
+    """
+    return asyncio.run(closing_client(run_agent_async(goal, use_cache)))
+
+
+async def run_agent_async(goal: str, use_cache: bool = LLM_CACHE_ENABLED):
+    """
+    Async body of run_agent. Each iteration requests several candidate
+    solutions in parallel and keeps the first that succeeds (or the best one).
     """
     console.print(Panel(f"[bold green]GOAL:[/bold green] {goal}", title="Coding Agent Starting"))
 
     # Initialize memory systems
     memory = ShortTermMemory(max_size=5)
     long_term_memory = LongTermMemory()
+    llm_cache = LLMCache() if use_cache else None
     
     # Initialize safety systems
     circuit_breaker = CircuitBreaker(max_consecutive_failures=3)
     rate_limiter = RateLimiter(max_requests=20, window_seconds=60)
     
-    messages = []
-    
     # Check for similar past solutions
     similar = long_term_memory.find_similar(goal, top_k=2, min_similarity=0.3)
     if similar:
@@ -146,6 +615,9 @@ def run_agent(goal: str):
         for solution, similarity in similar:
             console.print(f"  - '{solution.goal}' (similarity: {similarity:.0%}, solved in {solution.iterations_to_solve} iterations)")
 
+    # The goal header is stable for the whole run, so build it once
+    goal_header = build_goal_header(goal, similar)
+
     for iteration in range(1, MAX_ITERATIONS + 1):
         console.print(f"\n[bold yellow]--- Iteration {iteration}/{MAX_ITERATIONS} ---[/bold yellow]")
         
@@ -163,7 +635,8 @@ def run_agent(goal: str):
             console.print(f"[bold red]{rate_msg}[/bold red]")
             break
         
-        rate_limiter.record_request()
+        for _ in range(CANDIDATES_PER_ITERATION):
+            rate_limiter.record_request()
         
         # Show memory summary if we have previous attempts
         if memory.count() > 0:
@@ -171,29 +644,34 @@ def run_agent(goal: str):
             console.print(f"[dim]Memory: {summary['successful_attempts']} succeeded, {summary['failed_attempts']} failed | Progress: {summary['progress']}[/dim]")
 
         # Build the prompt with reflection and retrieval
-        user_prompt = build_user_prompt(goal, memory, long_term_memory)
+        user_content = build_user_prompt(goal_header, memory)
+
+        # A single turn is enough - the prompt already summarizes every previous
+        # attempt, so resending old turns would only make the input grow quadratically
+        request_messages = [{"role": "user", "content": user_content}]
 
-        # Add to message history
-        messages.append({"role": "user", "content": user_prompt})
+        # Call the Claude API (system prompt and goal header are cached)
+        if CANDIDATES_PER_ITERATION > 1:
+            console.print(f"[dim]Calling Claude API and executing {CANDIDATES_PER_ITERATION} candidates in parallel...[/dim]")
+        else:
+            console.print("[dim]Calling Claude API and executing code...[/dim]")
+        candidates = await run_candidates(_SYSTEM_BLOCKS, request_messages, llm_cache)
 
-        # Call the Claude API
-        console.print("[dim]Calling Claude API...[/dim]")
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=MAX_TOKENS,
-            system=build_system_prompt(),
-            messages=messages
-        )
+        if len(candidates) > 1:
+            for candidate in candidates:
+                console.print(f"[dim]  Candidate {candidate.index + 1}: {candidate_status(candidate)}[/dim]")
 
-        assistant_message = response.content[0].text
-        messages.append({"role": "assistant", "content": assistant_message})
+        # Keep one candidate per iteration so memory and history stay linear
+        chosen = max(candidates, key=candidate_rank)
+        if chosen.from_cache:
+            console.print("[dim]⚡ Served from response cache[/dim]")
+        assistant_message = chosen.response
 
         console.print(f"\n[bold cyan]Claude's response:[/bold cyan] {assistant_message[:200]}...")
 
-        # Extract code from response
-        code = extract_code(assistant_message)
+        code = chosen.code
 
-        if not code:
+        if chosen.blocked_by == "NoCodeReturned":
             console.print("[bold red]No code found in response. Retrying...[/bold red]")
             memory.add(Attempt(
                 iteration=iteration,
@@ -206,27 +684,25 @@ def run_agent(goal: str):
             continue
 
         # Show the code
-        console.print(Panel(Syntax(code, "python", theme="monokai"), title=f"Code - Attempt {iteration}"))
+        show_code(code, f"Code - Attempt {iteration}")
 
         # Basic safety check
-        is_safe, safety_message = is_code_safe(code)
-        if not is_safe:
-            console.print(f"[bold red]SAFETY BLOCK:[/bold red] {safety_message}")
+        if chosen.blocked_by == "SafetyBlock":
+            console.print(f"[bold red]SAFETY BLOCK:[/bold red] {chosen.block_message}")
             memory.add(Attempt(
                 iteration=iteration,
                 code=code,
                 success=False,
                 output="",
-                error=safety_message
+                error=chosen.block_message
             ))
             circuit_breaker.record_attempt(success=False, error_type="SafetyBlock")
             continue
         
         # Advanced safety check
-        is_safe_advanced, warnings = AdvancedSafetyChecker.check_all(code)
-        if not is_safe_advanced:
+        if chosen.blocked_by == "AdvancedSafetyBlock":
             console.print(f"[bold red]⚠️ ADVANCED SAFETY WARNING:[/bold red]")
-            for warning in warnings:
+            for warning in chosen.warnings:
                 console.print(f"  - {warning}")
             console.print("[dim]Skipping execution due to safety concerns.[/dim]")
             memory.add(Attempt(
@@ -234,19 +710,16 @@ def run_agent(goal: str):
                 code=code,
                 success=False,
                 output="",
-                error="; ".join(warnings)
+                error=chosen.block_message
             ))
             circuit_breaker.record_attempt(success=False, error_type="AdvancedSafetyBlock")
             continue
 
-        # Execute the code
-        console.print("[dim]Executing code...[/dim]")
-        result = execute_code(code)
+        # The code already ran alongside the other candidates
+        result = chosen.result
 
-        # Parse test results if present
-        test_results = None
-        if "tests passed" in result.output.lower() or "tests failed" in result.error.lower():
-            test_results = parse_test_results(result)
+        # Test summary reported by the sandbox, if the code had tests
+        test_results = result.test_results
 
         # Record in circuit breaker
         circuit_breaker.record_attempt(success=result.success, error_type=result.error.split('\n')[0] if not result.success else None)
@@ -261,15 +734,12 @@ def run_agent(goal: str):
             test_results=test_results
         ))
 
-        # Log this attempt to disk
-        log_attempt(goal, iteration, code, result)
+        # Log this attempt to disk in the background
+        submit_log(goal, iteration, code, result)
 
         # Show result
         if result.success:
-            console.print(Panel(
-                f"[bold green]SUCCESS[/bold green]\n{result.output}\nTime: {result.execution_time:.2f}s",
-                title="Result"
-            ))
+            show_result("SUCCESS", "green", result.output, result.execution_time)
             
             # Store successful solution in long-term memory
             if test_results:
@@ -295,10 +765,7 @@ def run_agent(goal: str):
             console.print(f"[dim]Circuit breaker: {cb_status['failures']} failures, success rate {cb_status['success_rate']:.0%}[/dim]")
             return True
         else:
-            console.print(Panel(
-                f"[bold red]FAILED[/bold red]\n{result.error}\nTime: {result.execution_time:.2f}s",
-                title="Result"
-            ))
+            show_result("FAILED", "red", result.error, result.execution_time)
 
     console.print(f"\n[bold red]❌ Agent stopped after {MAX_ITERATIONS} iterations without success.[/bold red]")
     
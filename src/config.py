@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,21 +11,29 @@ MODEL = "claude-sonnet-4-5-20250929"
 # Agent Configuration
 MAX_ITERATIONS = 5
 MAX_TOKENS = 4096
+PROMPT_TOKEN_BUDGET = 6000  # Approximate cap on the user prompt; older attempt summaries are dropped first
+STOP_STREAM_AFTER_CODE = True  # Close the response stream once a full code block has arrived
+CANDIDATES_PER_ITERATION = 1  # Parallel solutions requested per iteration - each one costs a full request, so >1 is opt-in
+CANDIDATE_TEMPERATURES = [1.0, 0.7, 0.4]  # Cycled across candidates for some variety
+BATCH_POLL_SECONDS = 10  # How often to check on a Message Batch in --batch mode
 
 # Paths
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOGS_DIR = os.path.join(BASE_DIR, "logs")
-MEMORY_DIR = os.path.join(BASE_DIR, "memory")
+BASE_DIR = Path(__file__).resolve().parents[1]
+LOGS_DIR = BASE_DIR / "logs"
+MEMORY_DIR = BASE_DIR / "memory"
 
-# Ensure directories exist
-os.makedirs(LOGS_DIR, exist_ok=True)
-os.makedirs(MEMORY_DIR, exist_ok=True)
+# Ensure directories exist (skip the mkdir syscalls on the usual warm start)
+for directory in (LOGS_DIR, MEMORY_DIR):
+    if not directory.exists():
+        directory.mkdir(parents=True, exist_ok=True)
 
 # Sandbox Configuration
 CPU_TIME_LIMIT = 5  # seconds of actual CPU time
 MEMORY_LIMIT_MB = 256  # megabytes
 FILE_SIZE_LIMIT_MB = 10  # megabytes per file
 EXECUTION_TIMEOUT = 10  # wall-clock seconds
+SANDBOX_POOL_ENABLED = True  # Reuse a warm worker process instead of a fresh interpreter per run
+SANDBOX_POOL_SIZE = CANDIDATES_PER_ITERATION  # Warm workers, so candidates can execute in parallel
 
 # Memory Configuration
 SHORT_TERM_MEMORY_SIZE = 5  # Number of attempts to keep in memory
@@ -34,6 +43,12 @@ LONG_TERM_MEMORY_PATH = "memory/solutions.json"
 SIMILARITY_THRESHOLD = 0.3  # Minimum 30% similarity to retrieve
 MAX_SIMILAR_SOLUTIONS = 2  # Show top 2 similar solutions
 
+# Response Cache Configuration
+LLM_CACHE_ENABLED = False  # Opt in (or pass --cache) to replay identical requests from disk instead of calling the API
+LLM_CACHE_PATH = MEMORY_DIR / "llm_cache.db"
+LLM_CACHE_TTL_HOURS = 24  # Cached responses older than this are ignored and pruned
+LLM_CACHE_MAX_ENTRIES = 500  # Only the newest entries are kept
+
 # Circuit Breaker Configuration
 MAX_CONSECUTIVE_FAILURES = 3  # Open circuit after this many failures
 FAILURE_WINDOW_MINUTES = 5  # Time window for tracking failures
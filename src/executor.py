@@ -1,12 +1,237 @@
 import subprocess
 import sys
 import os
-import tempfile
 import time
+import asyncio
 import platform 
-from dataclasses import dataclass
-from src.config import LOGS_DIR
-from src.test_runner import run_tests
+import json
+import ast
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Optional
+from src.config import LOGS_DIR, SANDBOX_POOL_ENABLED, CPU_TIME_LIMIT, MEMORY_LIMIT_MB, FILE_SIZE_LIMIT_MB
+from src.test_runner import TestResult
+from src.sandbox_pool import SandboxPool, SandboxJob, get_sandbox_pool
+
+try:
+    import resource  # POSIX only - lets us set the sandbox limits from preexec_fn
+except ImportError:
+    resource = None
+
+try:
+    import ahocorasick  # Optional: pyahocorasick speeds up is_code_safe
+except ImportError:
+    ahocorasick = None
+
+# Loaded by the sandbox wrapper so tests run in the same process as the user code
+TEST_RUNNER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_runner.py")
+
+# Substrings that get code blocked when it can't be parsed for the AST check
+DANGEROUS_PATTERNS = [
+    ("import shutil", "filesystem manipulation"),
+    ("rmdir", "directory deletion"),
+    ("os.remove", "file deletion"),
+    ("os.unlink", "file deletion"),
+    ("subprocess", "subprocess spawning"),
+    ("__import__", "dynamic imports"),
+    ("eval(", "dynamic code evaluation"),
+    ("exec(", "dynamic code execution"),
+    ("open(", "file system access"),
+    ("socket", "network access"),
+    ("requests", "network access"),
+    ("urllib", "network access"),
+    ("http.client", "network access"),
+]
+
+
+def build_safety_automaton():
+    """
+    Build an Aho-Corasick automaton over DANGEROUS_PATTERNS so the code is
+    scanned once rather than once per pattern. Returns None if the optional
+    pyahocorasick package isn't installed.
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pattern, reason in DANGEROUS_PATTERNS:
+        automaton.add_word(pattern, (pattern, reason))
+    automaton.make_automaton()
+    return automaton
+
+
+_SAFETY_AUTOMATON = build_safety_automaton()
+
+# Modules that can't be imported at all (matched on the top-level package)
+BANNED_MODULES = {
+    "subprocess": "subprocess spawning",
+    "shutil": "filesystem manipulation",
+    "socket": "network access",
+    "requests": "network access",
+    "urllib": "network access",
+    "http": "network access",
+    "importlib": "dynamic imports",
+}
+
+# Functions that can't be called or referenced, by fully-qualified name
+BANNED_CALLS = {
+    "eval": "dynamic code evaluation",
+    "exec": "dynamic code execution",
+    "__import__": "dynamic imports",
+    "open": "file system access",
+    "io.open": "file system access",
+    "os.open": "file system access",
+    "os.fdopen": "file system access",
+    "codecs.open": "file system access",
+    "gzip.open": "file system access",
+    "bz2.open": "file system access",
+    "lzma.open": "file system access",
+    "tarfile.open": "file system access",
+    "os.remove": "file deletion",
+    "os.unlink": "file deletion",
+    "os.rmdir": "directory deletion",
+    "os.removedirs": "directory deletion",
+    "os.system": "subprocess spawning",
+    "os.popen": "subprocess spawning",
+}
+
+# Methods that can't be called on anything - only paths have them, and we can't
+# always tell the receiver's type statically
+BANNED_METHODS = {
+    "write_text": "file writing",
+    "write_bytes": "file writing",
+}
+
+# pathlib methods that are only blocked when the receiver is known to be a path
+# (Path(p).unlink(), p.rmdir() after p = Path(...)). Lists have remove(), archives
+# have open(), so banning these names on any receiver blocks plenty of safe code.
+PATH_METHODS = {
+    "open": "file system access",
+    "unlink": "file deletion",
+    "rmdir": "directory deletion",
+}
+PATH_METHODS.update(BANNED_METHODS)
+
+# Attribute names that are blocked when fetched dynamically from an unknown
+# receiver. Names that ordinary objects have too (open, remove, ...) are only
+# blocked once the receiver resolves, e.g. getattr(os, 'remove').
+BANNED_ATTRIBUTES = {
+    name.rpartition(".")[2]: reason for name, reason in BANNED_CALLS.items()
+    if name.rpartition(".")[2] not in {"open", "remove", "unlink", "rmdir"}
+}
+BANNED_ATTRIBUTES.update(BANNED_METHODS)
+
+
+class UnsafeCode(Exception):
+    """Raised by SafetyVisitor on the first banned construct"""
+
+
+class SafetyVisitor(ast.NodeVisitor):
+    """
+    Walks the AST looking for banned imports, calls and dynamic attribute lookups.
+    Tracks import aliases so `import os as o; o.remove(...)` and
+    `from os import remove` are caught too, and names bound to pathlib paths
+    so `p = Path(...); p.unlink()` is.
+    """
+
+    def __init__(self):
+        self.aliases = {}  # local name -> fully-qualified name
+        self.path_names = set()  # local names assigned a pathlib path
+
+    def check_module(self, module: str):
+        root = module.split(".", 1)[0]
+        if root in BANNED_MODULES:
+            raise UnsafeCode(f"Blocked: code imports '{module}' ({BANNED_MODULES[root]})")
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.check_module(alias.name)
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.module:
+            self.check_module(node.module)
+            for alias in node.names:
+                qualified = f"{node.module}.{alias.name}"
+                self.check_name(qualified)
+                self.aliases[alias.asname or alias.name] = qualified
+        self.generic_visit(node)
+
+    def qualified_name(self, node: ast.AST) -> Optional[str]:
+        """Resolve a Name/Attribute chain like `o.path.join` to 'os.path.join'"""
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id, node.id)
+        if isinstance(node, ast.Attribute):
+            base = self.qualified_name(node.value)
+            return f"{base}.{node.attr}" if base else None
+        return None
+
+    def is_path(self, node: ast.AST) -> bool:
+        """Whether an expression is a pathlib path: Path(p), Path.home() / 'x', p.parent, ..."""
+        if isinstance(node, ast.Name):
+            return node.id in self.path_names
+        if isinstance(node, ast.Call):
+            name = self.qualified_name(node.func)
+            if name and name.startswith("pathlib."):
+                return True
+            return self.is_path(node.func)  # p.with_suffix(...), p.resolve()
+        if isinstance(node, ast.Attribute):
+            return self.is_path(node.value)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+            return self.is_path(node.left)
+        return False
+
+    def check_name(self, name: Optional[str]):
+        if name and name.startswith("builtins."):
+            name = name[len("builtins."):]
+        if name in BANNED_CALLS:
+            raise UnsafeCode(f"Blocked: code uses '{name}' ({BANNED_CALLS[name]})")
+        # Path.unlink(p) and friends, called through the class
+        if name and name.startswith("pathlib."):
+            attr = name.rpartition(".")[2]
+            if attr in PATH_METHODS:
+                raise UnsafeCode(f"Blocked: code uses '{name}' ({PATH_METHODS[attr]})")
+
+    def visit_Assign(self, node: ast.Assign):
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                if self.is_path(node.value):
+                    self.path_names.add(target.id)
+                else:
+                    self.path_names.discard(target.id)
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.check_name(self.qualified_name(node))
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if isinstance(node.ctx, ast.Load):
+            self.check_name(self.qualified_name(node))
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        # x.write_text(...) whatever x is, Path(p).unlink() and friends on paths
+        if isinstance(node.func, ast.Attribute):
+            attr = node.func.attr
+            if attr in BANNED_METHODS or (attr in PATH_METHODS and self.is_path(node.func.value)):
+                raise UnsafeCode(f"Blocked: code calls '.{attr}()' ({PATH_METHODS[attr]})")
+        # getattr(os, 'remove') and friends
+        if (isinstance(node.func, ast.Name) and node.func.id == "getattr"
+                and len(node.args) >= 2
+                and isinstance(node.args[1], ast.Constant)
+                and isinstance(node.args[1].value, str)):
+            receiver, attr = node.args[0], node.args[1].value
+            if attr in BANNED_ATTRIBUTES:
+                raise UnsafeCode(f"Blocked: code uses getattr(..., '{attr}') ({BANNED_ATTRIBUTES[attr]})")
+            if attr in PATH_METHODS and self.is_path(receiver):
+                raise UnsafeCode(f"Blocked: code uses getattr(..., '{attr}') ({PATH_METHODS[attr]})")
+            base = self.qualified_name(receiver)
+            if base:
+                self.check_name(f"{base}.{attr}")
+        self.generic_visit(node)
+
 
 @dataclass
 class ExecutionResult:
@@ -14,17 +239,12 @@ class ExecutionResult:
     output: str
     error: str
     execution_time: float
+    test_results: Optional[dict] = None  # TestResult fields, when the code's tests ran
 
 
-def get_resource_limit_script():
-    """
-    Generate a Python script that sets resource limits before executing code.
-    Works cross-platform (macOS and Linux).
-    """
-    return '''
-import sys
-import os
-
+# Sets resource limits in the sandbox interpreter before any user code runs.
+# Only needed where they can't be applied from preexec_fn (see _apply_limits).
+RESOURCE_LIMIT_PREAMBLE = '''
 # Try to set resource limits (works on Unix-like systems)
 try:
     import resource
@@ -45,11 +265,99 @@ try:
 except (ImportError, ValueError, OSError) as e:
     # Resource limits not available on this platform
     pass
-
-# Now execute the actual user code
-exec(compile(open(sys.argv[1]).read(), sys.argv[1], 'exec'))
 '''
 
+# Prefixes the line the sandbox prints its JSON test summary on
+TEST_JSON_MARKER = "__TESTJSON__"
+
+# Reads the user code from stdin, runs it, and optionally its tests. The wrapper's
+# own state lives inside a function and the user code gets a fresh __main__, so
+# nothing the code defines can clobber it.
+SANDBOX_RUNNER = '''
+import sys
+import os
+import types
+
+
+def _sandbox_main():
+    run_tests = sys.argv[1:] == ["--run-tests"]
+    sys.argv = sys.argv[:1]  # Hide wrapper args from unittest.main()
+
+    # Now execute the actual user code, piped in on stdin
+    user_code = sys.stdin.read()
+    sys.stdin = open(os.devnull)
+
+    # Give the code its own __main__ so unittest.main() finds its tests
+    main_module = types.ModuleType("__main__")
+    main_module.__builtins__ = __builtins__
+    sys.modules["__main__"] = main_module
+    try:
+        exec(compile(user_code, '<user>', 'exec'), main_module.__dict__)
+    except SystemExit as e:
+        # unittest.main() exits even on success - keep going so we can report results
+        if not run_tests or e.code not in (0, None):
+            raise
+
+    # Run the tests here instead of spawning a second interpreter
+    if run_tests:
+        import json
+        import importlib.util
+        from dataclasses import asdict
+
+        spec = importlib.util.spec_from_file_location("_sandbox_test_runner", TEST_RUNNER_PATH)
+        test_runner = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(test_runner)
+
+        test_result = test_runner.run_tests_in_namespace(main_module.__dict__)
+        # Own line at the very end of stdout, even if the code left a partial line
+        sys.__stdout__.write("\\n" + TEST_JSON_MARKER + json.dumps(asdict(test_result)) + "\\n")
+
+
+_sandbox_main()
+'''.replace("TEST_RUNNER_PATH", repr(TEST_RUNNER_PATH)).replace("TEST_JSON_MARKER", repr(TEST_JSON_MARKER))
+
+
+# Apply limits in the child between fork and exec instead of in a wrapper preamble
+PREEXEC_LIMITS = os.name == "posix" and resource is not None
+
+
+def _apply_limits():
+    """
+    Set CPU, memory and file size limits in the sandbox child before it execs.
+    Runs between fork and exec while other threads may exist, so it sticks to
+    setrlimit calls - no imports, no locks.
+    """
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (CPU_TIME_LIMIT, CPU_TIME_LIMIT))
+
+        try:
+            memory_bytes = MEMORY_LIMIT_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        except (ValueError, OSError):
+            # macOS sometimes fails here, that's okay
+            pass
+
+        file_size_bytes = FILE_SIZE_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_bytes, file_size_bytes))
+
+    except (ValueError, OSError):
+        pass
+
+
+def get_resource_limit_script():
+    """
+    Generate the Python script the sandbox interpreter runs.
+
+    The script is passed with -c and reads the user code from stdin. With
+    --run-tests it also runs the code's unittest tests in the same interpreter
+    and prints a JSON summary as the last stdout line, after TEST_JSON_MARKER.
+    On POSIX the limits are already set by _apply_limits, so the script skips
+    its resource-limit preamble.
+    """
+    if PREEXEC_LIMITS:
+        return SANDBOX_RUNNER
+    return RESOURCE_LIMIT_PREAMBLE + SANDBOX_RUNNER
+
 
 def execute_code(code: str, timeout: int = 10) -> ExecutionResult:
     """
@@ -62,117 +370,90 @@ def execute_code(code: str, timeout: int = 10) -> ExecutionResult:
     4. Wall-clock timeout (kills after 10 seconds regardless of CPU usage)
     5. Filesystem restricted to logs directory
     6. File size limits (10MB per file)
+
+    Uses the warm sandbox pool when available, otherwise a fresh interpreter.
     """
+    if SANDBOX_POOL_ENABLED and SandboxPool.is_supported():
+        return execute_in_pool(code, timeout)
+    return execute_in_subprocess(code, timeout)
+
+
+async def execute_code_async(code: str, timeout: int = 10) -> ExecutionResult:
+    """
+    Awaitable execute_code, so several candidates can run at once.
+    Cancelling it kills the sandboxed run, so a losing candidate doesn't keep
+    the winner waiting for its execution to finish.
+    """
+    if SANDBOX_POOL_ENABLED and SandboxPool.is_supported():
+        # The pool blocks on its worker, so wait in a thread and kill the worker to cancel
+        job = SandboxJob()
+        try:
+            return await asyncio.to_thread(execute_in_pool, code, timeout, job)
+        except asyncio.CancelledError:
+            get_sandbox_pool().cancel(job)
+            raise
+    return await execute_in_subprocess_async(code, timeout)
+
+
+def execute_in_pool(code: str, timeout: int = 10, job: Optional[SandboxJob] = None) -> ExecutionResult:
+    """Run code in a forked child of the warm sandbox worker. job lets another thread cancel the run."""
     start_time = time.time()
+    code_has_tests = 'unittest.TestCase' in code
 
-    # Write the user's code to a temporary file
-    with tempfile.NamedTemporaryFile(
-        mode='w',
-        suffix='_user.py',
-        delete=False,
-        dir=LOGS_DIR
-    ) as user_file:
-        user_file.write(code)
-        user_code_path = user_file.name
-
-    # Write the resource-limiting wrapper script
-    with tempfile.NamedTemporaryFile(
-        mode='w',
-        suffix='_wrapper.py',
-        delete=False,
-        dir=LOGS_DIR
-    ) as wrapper_file:
-        wrapper_file.write(get_resource_limit_script())
-        wrapper_path = wrapper_file.name
+    try:
+        outcome = get_sandbox_pool().submit(code, timeout, run_tests=code_has_tests, job=job)
+    except Exception as e:
+        return ExecutionResult(
+            success=False,
+            output="",
+            error=f"Execution failed: {str(e)}",
+            execution_time=time.time() - start_time
+        )
+
+    if outcome.timed_out:
+        # Wall-clock timeout
+        return ExecutionResult(
+            success=False,
+            output="",
+            error=f"Execution timed out after {timeout} seconds",
+            execution_time=timeout
+        )
+
+    test_result = None
+    if code_has_tests and outcome.returncode == 0:
+        if outcome.test_result is not None:
+            test_result = TestResult(**outcome.test_result)
+        else:
+            test_result = missing_test_result("Sandbox did not report test results")
+
+    return build_execution_result(
+        outcome.returncode, outcome.stdout, outcome.stderr, test_result,
+        time.time() - start_time
+    )
+
+
+def execute_in_subprocess(code: str, timeout: int = 10) -> ExecutionResult:
+    """Run code in a fresh, resource-limited interpreter via the sandbox wrapper script."""
+    start_time = time.time()
+
+    code_has_tests = 'unittest.TestCase' in code
 
     try:
-        # Run the wrapper script which sets limits then executes user code
+        # Run the wrapper which executes the piped-in user code and runs its tests
         result = subprocess.run(
-            [sys.executable, wrapper_path, user_code_path],
+            sandbox_command(code_has_tests),
+            input=code,
             capture_output=True,
             text=True,
             timeout=timeout,
             cwd=LOGS_DIR,  # Restrict filesystem access
-            env={
-                'PATH': os.environ.get('PATH', ''),
-                'PYTHONPATH': '',  # Isolate from system packages
-            }
+            preexec_fn=_apply_limits if PREEXEC_LIMITS else None,
+            env=sandbox_env()
         )
 
-        execution_time = time.time() - start_time
-
-        # Check if code contains tests
-        code_has_tests = 'unittest.TestCase' in code
-        
-        if code_has_tests and result.returncode == 0:
-            # Run the test suite
-            test_result = run_tests(code)
-            
-            if test_result.success:
-                # All tests passed
-                return ExecutionResult(
-                    success=True,
-                    output=f"✅ All tests passed! ({test_result.passed}/{test_result.total_tests})\n{result.stdout.strip()}",
-                    error=result.stderr.strip(),
-                    execution_time=execution_time
-                )
-            else:
-                # Some tests failed - provide detailed feedback
-                failure_details = []
-                for failure in test_result.failures:
-                    failure_details.append(
-                        f"❌ {failure['test_name']}\n"
-                        f"   {failure['message']}"
-                    )
-                
-                error_msg = (
-                    f"Tests failed: {test_result.passed}/{test_result.total_tests} passed\n\n"
-                    + "\n\n".join(failure_details)
-                )
-                
-                return ExecutionResult(
-                    success=False,
-                    output=result.stdout.strip(),
-                    error=error_msg,
-                    execution_time=execution_time
-                )
-        
-        # No tests or code crashed - check exit codes
-        if result.returncode == -9 or result.returncode == 137:
-            return ExecutionResult(
-                success=False,
-                output=result.stdout.strip(),
-                error="Process killed by system - likely exceeded CPU or memory limit",
-                execution_time=execution_time
-            )
-        elif result.returncode == 158 or 'CPU time limit exceeded' in result.stderr:
-            return ExecutionResult(
-                success=False,
-                output=result.stdout.strip(),
-                error="CPU time limit exceeded (5 seconds)",
-                execution_time=execution_time
-            )
-        elif result.returncode == 153 or 'File size limit exceeded' in result.stderr:
-            return ExecutionResult(
-                success=False,
-                output=result.stdout.strip(),
-                error="File size limit exceeded (10MB per file)",
-                execution_time=execution_time
-            )
-        elif result.returncode == 0:
-            return ExecutionResult(
-                success=True,
-                output=result.stdout.strip(),
-                error=result.stderr.strip(),
-                execution_time=execution_time
-            )
-        else:
-            return ExecutionResult(
-                success=False,
-                output=result.stdout.strip(),
-                error=result.stderr.strip() or f"Process exited with code {result.returncode}",
-                execution_time=execution_time
-            )
+        return subprocess_result(
+            code_has_tests, result.returncode, result.stdout, result.stderr, time.time() - start_time
+        )
 
     except subprocess.TimeoutExpired:
         # Wall-clock timeout
@@ -189,38 +470,220 @@ def execute_code(code: str, timeout: int = 10) -> ExecutionResult:
             error=f"Execution failed: {str(e)}",
             execution_time=time.time() - start_time
         )
-    finally:
-        # Always clean up temp files
-        for path in [user_code_path, wrapper_path]:
-            if os.path.exists(path):
-                try:
-                    os.remove(path)
-                except:
-                    pass
 
 
+async def execute_in_subprocess_async(code: str, timeout: int = 10) -> ExecutionResult:
+    """execute_in_subprocess on the event loop - cancelling it kills the sandbox interpreter."""
+    start_time = time.time()
+
+    code_has_tests = 'unittest.TestCase' in code
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *sandbox_command(code_has_tests),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=LOGS_DIR,  # Restrict filesystem access
+            preexec_fn=_apply_limits if PREEXEC_LIMITS else None,
+            env=sandbox_env()
+        )
+    except Exception as e:
+        return ExecutionResult(
+            success=False,
+            output="",
+            error=f"Execution failed: {str(e)}",
+            execution_time=time.time() - start_time
+        )
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(code.encode("utf-8")), timeout)
+    except asyncio.TimeoutError:
+        # Wall-clock timeout
+        process.kill()
+        await process.wait()
+        return ExecutionResult(
+            success=False,
+            output="",
+            error=f"Execution timed out after {timeout} seconds",
+            execution_time=timeout
+        )
+    except BaseException:
+        # Cancelled (or failed) mid-run - don't leave the interpreter running
+        if process.returncode is None:
+            process.kill()
+        raise
+
+    return subprocess_result(
+        code_has_tests, process.returncode,
+        stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace"),
+        time.time() - start_time
+    )
+
+
+def sandbox_command(code_has_tests: bool) -> list:
+    """Command line for a fresh sandbox interpreter running the wrapper script"""
+    command = [sys.executable, '-c', get_resource_limit_script()]
+    if code_has_tests:
+        command.append('--run-tests')
+    return command
+
+
+def sandbox_env() -> dict:
+    """Minimal environment for the sandbox interpreter"""
+    return {
+        'PATH': os.environ.get('PATH', ''),
+        'PYTHONPATH': '',  # Isolate from system packages
+    }
+
+
+def subprocess_result(code_has_tests: bool, returncode: int, stdout: str, stderr: str,
+                      execution_time: float) -> ExecutionResult:
+    """ExecutionResult for a finished sandbox interpreter run."""
+    # Tests already ran inside the sandbox - pull their summary off stdout
+    stdout, test_result = split_test_result(stdout)
+    if code_has_tests and returncode == 0 and test_result is None:
+        test_result = missing_test_result("Sandbox did not report test results")
+
+    return build_execution_result(returncode, stdout, stderr, test_result, execution_time)
+
+
+def build_execution_result(returncode: int, stdout: str, stderr: str,
+                           test_result: Optional[TestResult], execution_time: float) -> ExecutionResult:
+    """Turn a finished sandbox run (exit code, output, test summary) into an ExecutionResult."""
+    if test_result is not None:
+        if test_result.success:
+            # All tests passed
+            return ExecutionResult(
+                success=True,
+                output=f"✅ All tests passed! ({test_result.passed}/{test_result.total_tests})\n{stdout.strip()}",
+                error=stderr.strip(),
+                execution_time=execution_time,
+                test_results=asdict(test_result)
+            )
+        else:
+            # Some tests failed - provide detailed feedback
+            failure_details = []
+            for failure in test_result.failures:
+                failure_details.append(
+                    f"❌ {failure['test_name']}\n"
+                    f"   {failure['message']}"
+                )
+            
+            error_msg = (
+                f"Tests failed: {test_result.passed}/{test_result.total_tests} passed\n\n"
+                + "\n\n".join(failure_details)
+            )
+            
+            return ExecutionResult(
+                success=False,
+                output=stdout.strip(),
+                error=error_msg,
+                execution_time=execution_time,
+                test_results=asdict(test_result)
+            )
+    
+    # No tests or code crashed - check exit codes
+    if returncode == -9 or returncode == 137:
+        return ExecutionResult(
+            success=False,
+            output=stdout.strip(),
+            error="Process killed by system - likely exceeded CPU or memory limit",
+            execution_time=execution_time
+        )
+    elif returncode == 158 or 'CPU time limit exceeded' in stderr:
+        return ExecutionResult(
+            success=False,
+            output=stdout.strip(),
+            error="CPU time limit exceeded (5 seconds)",
+            execution_time=execution_time
+        )
+    elif returncode == 153 or 'File size limit exceeded' in stderr:
+        return ExecutionResult(
+            success=False,
+            output=stdout.strip(),
+            error="File size limit exceeded (10MB per file)",
+            execution_time=execution_time
+        )
+    elif returncode == 0:
+        return ExecutionResult(
+            success=True,
+            output=stdout.strip(),
+            error=stderr.strip(),
+            execution_time=execution_time
+        )
+    else:
+        return ExecutionResult(
+            success=False,
+            output=stdout.strip(),
+            error=stderr.strip() or f"Process exited with code {returncode}",
+            execution_time=execution_time
+        )
+
+
+def split_test_result(stdout: str) -> tuple:
+    """Separate the sandbox's trailing JSON test summary line from the code's own output."""
+    output, marker, summary = stdout.rpartition("\n" + TEST_JSON_MARKER)
+    if not marker:
+        return stdout, None
+    try:
+        return output, TestResult(**json.loads(summary))
+    except (ValueError, TypeError) as e:
+        return output, missing_test_result(f"Could not read test results from sandbox: {e}")
+
+
+def missing_test_result(message: str) -> TestResult:
+    """Failed TestResult for when the sandbox didn't hand back a test summary."""
+    return TestResult(
+        total_tests=0,
+        passed=0,
+        failed=0,
+        errors=1,
+        failures=[{
+            'test_name': 'test_results',
+            'error_type': 'MissingTestResults',
+            'message': message,
+            'traceback': ''
+        }],
+        success=False
+    )
+
+
+@lru_cache(maxsize=128)
 def is_code_safe(code: str) -> tuple:
     """
-    Basic static analysis to detect dangerous operations.
+    Static analysis to detect dangerous operations, done on the AST so names
+    inside strings and comments don't trigger false blocks.
+    Results are cached so identical retries skip the re-parse.
     Returns (is_safe: bool, message: str)
     """
-    dangerous_patterns = [
-        ("import shutil", "filesystem manipulation"),
-        ("rmdir", "directory deletion"),
-        ("os.remove", "file deletion"),
-        ("os.unlink", "file deletion"),
-        ("subprocess", "subprocess spawning"),
-        ("__import__", "dynamic imports"),
-        ("eval(", "dynamic code evaluation"),
-        ("exec(", "dynamic code execution"),
-        ("open(", "file system access"),
-        ("socket", "network access"),
-        ("requests", "network access"),
-        ("urllib", "network access"),
-        ("http.client", "network access"),
-    ]
-
-    for pattern, reason in dangerous_patterns:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        # Can't walk it - fall back to the conservative substring scan
+        return scan_dangerous_patterns(code)
+
+    checker = SafetyVisitor()
+    try:
+        checker.visit(tree)
+    except UnsafeCode as e:
+        return False, str(e)
+
+    return True, "Code passed safety check"
+
+
+def scan_dangerous_patterns(code: str) -> tuple:
+    """
+    Substring scan for DANGEROUS_PATTERNS, used when the code doesn't parse.
+    Returns (is_safe: bool, message: str)
+    """
+    if _SAFETY_AUTOMATON is not None:
+        # Single pass over the code for all patterns at once
+        for _, (pattern, reason) in _SAFETY_AUTOMATON.iter(code):
+            return False, f"Blocked: code contains '{pattern}' ({reason})"
+        return True, "Code passed safety check"
+
+    for pattern, reason in DANGEROUS_PATTERNS:
         if pattern in code:
             return False, f"Blocked: code contains '{pattern}' ({reason})"
 
@@ -0,0 +1,88 @@
+import sqlite3
+import json
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+from src.config import LLM_CACHE_PATH, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES
+
+
+@dataclass
+class CachedResponse:
+    """The parts of a Claude response the agent actually uses"""
+    text: str
+    usage: dict = field(default_factory=dict)
+    cached: bool = False  # True if served from the cache instead of the API
+
+
+class LLMCache:
+    """
+    Content-addressed cache for Claude responses, stored in sqlite.
+
+    Requests are keyed by a hash of (model, system prompt, messages), so replaying
+    the same goal with the same history returns the stored completion instantly
+    and costs zero tokens. Entries expire after ttl_hours, and only the newest
+    max_entries are kept.
+    """
+
+    def __init__(self, db_path: str = LLM_CACHE_PATH, ttl_hours: float = LLM_CACHE_TTL_HOURS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, usage TEXT NOT NULL, created_at TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system, messages: list, **params) -> str:
+        """Hash everything that influences the response (including extra request params) into a cache key"""
+        payload = json.dumps([model, system, messages, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Look up a stored, unexpired response by key"""
+        row = self.conn.execute(
+            "SELECT text, usage FROM responses WHERE key = ? AND created_at >= ?",
+            (key, self.oldest_valid())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse(text=row[0], usage=json.loads(row[1]), cached=True)
+
+    def put(self, key: str, text: str, usage: dict):
+        """Store a response under key, replacing any previous entry, then prune old entries"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, text, usage, created_at) VALUES (?, ?, ?, ?)",
+            (key, text, json.dumps(usage), datetime.now().isoformat())
+        )
+        self.conn.execute(
+            "DELETE FROM responses WHERE created_at < ? OR key NOT IN "
+            "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+            (self.oldest_valid(), self.max_entries)
+        )
+        self.conn.commit()
+
+    def oldest_valid(self) -> str:
+        """Creation time (isoformat, so it sorts as text) before which entries are expired"""
+        return (datetime.now() - self.ttl).isoformat()
+
+    def clear(self):
+        """Remove all cached responses"""
+        self.conn.execute("DELETE FROM responses")
+        self.conn.commit()
+
+    def count(self) -> int:
+        """Number of cached responses"""
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection"""
+        self.conn.close()
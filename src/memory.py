@@ -1,10 +1,22 @@
-from dataclasses import dataclass, asdict
-from typing import List, Optional
+from dataclasses import dataclass, field, fields
+from typing import Deque, List, Optional
+from collections import deque
+from itertools import islice
+import sys
 import json
 from datetime import datetime
 
+try:
+    import orjson  # Optional: faster memory serialization
+except ImportError:
+    orjson = None
 
-@dataclass 
+# dataclass(slots=True) is 3.10+; on 3.9 Attempt stays a regular dataclass
+# (hand-written __slots__ would clash with the field defaults)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class Attempt:
     """Represents a single attempt by the agent"""
     iteration: int
@@ -14,10 +26,36 @@ class Attempt:
     error: str
     test_results: Optional[dict] = None  # {total, passed, failed, failures: [...]}
     timestamp: str = ""
+    _error_first_line: str = field(default="", init=False, repr=False, compare=False)
+    _failure_names: frozenset = field(default=frozenset(), init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if not self.timestamp:
             self.timestamp = datetime.now().isoformat()
+        # Pattern checks and reflection only look at the first line of an error
+        self._error_first_line = self.error.partition('\n')[0]
+        # Names of the failing tests, for comparing attempts with a set intersection
+        self._failure_names = frozenset(
+            f['test_name'] for f in (self.test_results or {}).get('failures', ())
+        )
+    
+    @property
+    def error_first_line(self) -> str:
+        """First line of the error - pattern checks and reflection only look at this"""
+        return self._error_first_line
+    
+    def to_dict(self) -> dict:
+        """Serializable fields as a dict - private (underscore) fields are skipped, like orjson does"""
+        return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith('_')}
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "Attempt":
+        """Rebuild an attempt from its serialized form, recomputing the derived fields"""
+        return cls(**{name: value for name, value in data.items() if name in _ATTEMPT_INIT_FIELDS})
+
+
+# Fields passed to Attempt() - the rest are derived in __post_init__
+_ATTEMPT_INIT_FIELDS = frozenset(f.name for f in fields(Attempt) if f.init)
 
 
 class ShortTermMemory:
@@ -28,25 +66,38 @@ class ShortTermMemory:
     
     def __init__(self, max_size: int = 5):
         self.max_size = max_size
-        self.attempts: List[Attempt] = []
+        # Ring buffer - appending past max_size drops the oldest attempt in O(1)
+        self.attempts: Deque[Attempt] = deque(maxlen=max_size)
+        # Kept up to date by add() so get_summary doesn't rescan (failures = total - successes)
+        self._success_count = 0
+        # has_pattern dispatch table
+        self._pattern_checks = {
+            'same_error': self._same_error,
+            'same_test_failure': self._same_test_failure,
+            'no_progress': self._no_progress,
+        }
     
     def add(self, attempt: Attempt):
         """Add an attempt to memory, keeping only the last max_size attempts"""
+        if self.attempts and len(self.attempts) == self.attempts.maxlen:
+            # The deque is about to drop its oldest attempt
+            self._success_count -= self.attempts[0].success
         self.attempts.append(attempt)
-        if len(self.attempts) > self.max_size:
-            self.attempts.pop(0)  # Remove oldest
+        if self.attempts:  # A max_size of 0 keeps nothing
+            self._success_count += attempt.success
     
     def get_all(self) -> List[Attempt]:
         """Get all attempts in memory"""
-        return self.attempts.copy()
+        return list(self.attempts)
     
     def get_recent(self, n: int) -> List[Attempt]:
         """Get the last N attempts"""
-        return self.attempts[-n:] if n <= len(self.attempts) else self.attempts.copy()
+        return list(islice(self.attempts, max(0, len(self.attempts) - n), None))
     
     def clear(self):
         """Clear all attempts from memory"""
         self.attempts.clear()
+        self._success_count = 0
     
     def count(self) -> int:
         """Number of attempts in memory"""
@@ -61,44 +112,52 @@ class ShortTermMemory:
         - 'same_test_failure': Same test failing in last 2 attempts
         - 'no_progress': No successful tests in last 3 attempts
         """
-        if pattern_type == 'same_error' and len(self.attempts) >= 2:
-            last_two = self.attempts[-2:]
-            if not last_two[0].success and not last_two[1].success:
-                # Both failed - check if error is similar
-                error1 = last_two[0].error.split('\n')[0]  # First line of error
-                error2 = last_two[1].error.split('\n')[0]
-                return error1 == error2
-        
-        elif pattern_type == 'same_test_failure' and len(self.attempts) >= 2:
-            last_two = self.attempts[-2:]
-            if last_two[0].test_results and last_two[1].test_results:
-                failures1 = [f['test_name'] for f in last_two[0].test_results.get('failures', [])]
-                failures2 = [f['test_name'] for f in last_two[1].test_results.get('failures', [])]
-                # Check if any test failed in both attempts
-                return bool(set(failures1) & set(failures2))
-        
-        elif pattern_type == 'no_progress' and len(self.attempts) >= 3:
-            last_three = self.attempts[-3:]
-            # Check if all three attempts had zero passing tests
-            for attempt in last_three:
-                if attempt.success:
-                    return False
-                if attempt.test_results and attempt.test_results.get('passed', 0) > 0:
-                    return False
-            return True
-        
+        check = self._pattern_checks.get(pattern_type)
+        return check() if check is not None else False
+    
+    def _same_error(self) -> bool:
+        """Same error message in the last 2 attempts"""
+        if len(self.attempts) < 2:
+            return False
+        previous, last = self.attempts[-2], self.attempts[-1]
+        # Both failed - check if error is similar
+        return not previous.success and not last.success and previous.error_first_line == last.error_first_line
+    
+    def _same_test_failure(self) -> bool:
+        """Same test failing in the last 2 attempts"""
+        if len(self.attempts) < 2:
+            return False
+        previous, last = self.attempts[-2], self.attempts[-1]
+        if previous.test_results and last.test_results:
+            # Check if any test failed in both attempts
+            return bool(previous._failure_names & last._failure_names)
         return False
     
+    def _no_progress(self) -> bool:
+        """No successful tests in the last 3 attempts"""
+        if len(self.attempts) < 3:
+            return False
+        # Check if all three attempts had zero passing tests
+        for index in (-3, -2, -1):
+            attempt = self.attempts[index]
+            if attempt.success:
+                return False
+            if attempt.test_results and attempt.test_results.get('passed', 0) > 0:
+                return False
+        return True
+    
     def get_summary(self) -> dict:
         """Get a summary of all attempts in memory"""
         if not self.attempts:
             return {'total_attempts': 0}
         
+        total = len(self.attempts)
+        last = self.attempts[-1]
         return {
-            'total_attempts': len(self.attempts),
-            'successful_attempts': sum(1 for a in self.attempts if a.success),
-            'failed_attempts': sum(1 for a in self.attempts if not a.success),
-            'most_recent_error': self.attempts[-1].error if not self.attempts[-1].success else None,
+            'total_attempts': total,
+            'successful_attempts': self._success_count,
+            'failed_attempts': total - self._success_count,
+            'most_recent_error': last.error if not last.success else None,
             'progress': self._calculate_progress()
         }
     
@@ -107,14 +166,16 @@ class ShortTermMemory:
         if len(self.attempts) < 2:
             return "insufficient_data"
         
-        recent = self.attempts[-3:] if len(self.attempts) >= 3 else self.attempts
+        recent = self.get_recent(3)
         
         # Check if tests are improving
         if all(a.test_results for a in recent):
             passed_counts = [a.test_results.get('passed', 0) for a in recent]
-            if passed_counts == sorted(passed_counts):  # Increasing
+            # Single pass over neighbouring counts - no sorted copies
+            neighbours = list(zip(passed_counts, passed_counts[1:]))
+            if all(earlier <= later for earlier, later in neighbours):  # Increasing
                 return "improving"
-            elif passed_counts == sorted(passed_counts, reverse=True):  # Decreasing
+            elif all(earlier >= later for earlier, later in neighbours):  # Decreasing
                 return "regressing"
         
         # Check if moving from errors to test failures (that's progress)
@@ -128,12 +189,21 @@ class ShortTermMemory:
     
     def to_json(self) -> str:
         """Serialize memory to JSON"""
-        return json.dumps([asdict(a) for a in self.attempts], indent=2)
+        if orjson is not None:
+            # orjson walks the dataclasses itself, no asdict() copies needed
+            return orjson.dumps(list(self.attempts), option=orjson.OPT_INDENT_2).decode()
+        return json.dumps([a.to_dict() for a in self.attempts], indent=2)
     
     def from_json(self, json_str: str):
-        """Load memory from JSON"""
-        data = json.loads(json_str)
-        self.attempts = [Attempt(**item) for item in data]
+        """
+        Load memory from JSON.
+        test_results come back as the plain dicts they were saved as.
+        """
+        data = orjson.loads(json_str) if orjson is not None else json.loads(json_str)
+        # Only the newest max_size entries fit, so don't build attempts the deque would drop
+        kept = islice(data, max(0, len(data) - self.max_size), None)
+        self.attempts = deque(map(Attempt.from_dict, kept), maxlen=self.max_size)
+        self._success_count = sum(a.success for a in self.attempts)
 
 
 def build_reflection_prompt(memory: ShortTermMemory) -> str:
@@ -141,50 +211,57 @@ def build_reflection_prompt(memory: ShortTermMemory) -> str:
     Build a reflection prompt based on memory.
     This helps the agent analyze its past failures before trying again.
     """
-    if memory.count() == 0:
+    count = memory.count()
+    if count == 0:
         return ""
     
-    summary = memory.get_summary()
-    attempts = memory.get_all()
-    
-    reflection = "\n## Reflection on Previous Attempts\n\n"
-    reflection += f"You have made {summary['total_attempts']} attempt(s) so far.\n"
-    reflection += f"Progress status: {summary['progress']}\n\n"
-    
-    # Pattern detection warnings
-    if memory.has_pattern('same_error'):
-        reflection += "⚠️ WARNING: You've had the same error in your last 2 attempts. Try a completely different approach.\n\n"
+    # Collect fragments and join once at the end instead of growing a string
+    parts = [
+        "\n## Reflection on Previous Attempts\n\n",
+        f"You have made {count} attempt(s) so far.\n",
+    ]
     
-    if memory.has_pattern('same_test_failure'):
-        reflection += "⚠️ WARNING: The same test is failing repeatedly. Focus specifically on fixing that test.\n\n"
-    
-    if memory.has_pattern('no_progress'):
-        reflection += "⚠️ WARNING: No tests have passed in 3 attempts. Consider rewriting from scratch with a simpler approach.\n\n"
-    
-    # Recent attempt summary
-    if len(attempts) >= 2:
-        reflection += "Recent attempts:\n"
-        for attempt in attempts[-3:]:  # Last 3
+    # A single attempt has no progress, patterns or history to reflect on yet
+    if count < 2:
+        parts.append("Progress status: insufficient_data\n\n")
+    else:
+        parts.append(f"Progress status: {memory.get_summary()['progress']}\n\n")
+        
+        # Pattern detection warnings
+        if memory.has_pattern('same_error'):
+            parts.append("⚠️ WARNING: You've had the same error in your last 2 attempts. Try a completely different approach.\n\n")
+        
+        if memory.has_pattern('same_test_failure'):
+            parts.append("⚠️ WARNING: The same test is failing repeatedly. Focus specifically on fixing that test.\n\n")
+        
+        if memory.has_pattern('no_progress'):
+            parts.append("⚠️ WARNING: No tests have passed in 3 attempts. Consider rewriting from scratch with a simpler approach.\n\n")
+        
+        # Recent attempt summary
+        parts.append("Recent attempts:\n")
+        for attempt in memory.get_recent(3):
             status = "✅ SUCCESS" if attempt.success else "❌ FAILED"
-            reflection += f"\nAttempt {attempt.iteration}: {status}\n"
+            parts.append(f"\nAttempt {attempt.iteration}: {status}\n")
             
             if attempt.test_results:
                 passed = attempt.test_results.get('passed', 0)
                 total = attempt.test_results.get('total_tests', 0)
-                reflection += f"  Tests: {passed}/{total} passed\n"
+                parts.append(f"  Tests: {passed}/{total} passed\n")
                 
-                if attempt.test_results.get('failures'):
-                    reflection += "  Failed tests:\n"
-                    for failure in attempt.test_results['failures'][:2]:  # Show first 2
-                        reflection += f"    - {failure['test_name']}: {failure['message']}\n"
+                shown_failures = (attempt.test_results.get('failures') or [])[:2]  # Show first 2
+                if shown_failures:
+                    parts.append("  Failed tests:\n")
+                    for failure in shown_failures:
+                        parts.append(f"    - {failure['test_name']}: {failure['message']}\n")
             
             if not attempt.success and attempt.error:
-                error_preview = attempt.error.split('\n')[0][:100]
-                reflection += f"  Error: {error_preview}\n"
+                parts.append(f"  Error: {attempt.error_first_line[:100]}\n")
     
-    reflection += "\nBefore writing new code, ask yourself:\n"
-    reflection += "1. What specifically went wrong in the last attempt?\n"
-    reflection += "2. Am I repeating the same approach? Should I try something different?\n"
-    reflection += "3. Are there edge cases I'm missing?\n\n"
+    parts.append(
+        "\nBefore writing new code, ask yourself:\n"
+        "1. What specifically went wrong in the last attempt?\n"
+        "2. Am I repeating the same approach? Should I try something different?\n"
+        "3. Are there edge cases I'm missing?\n\n"
+    )
     
-    return reflection
+    return "".join(parts)
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import atexit
+import select
+import signal
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import List, Optional
+from src.config import LOGS_DIR, CPU_TIME_LIMIT, MEMORY_LIMIT_MB, FILE_SIZE_LIMIT_MB, SANDBOX_POOL_SIZE
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_PATH = os.path.join(SRC_DIR, "sandbox_worker.py")
+TEST_RUNNER_PATH = os.path.join(SRC_DIR, "test_runner.py")
+
+# Extra seconds to wait for the worker beyond the task's own timeout
+WORKER_GRACE_SECONDS = 5
+
+
+@dataclass
+class SandboxOutcome:
+    """Raw outcome of one sandboxed run, before it is turned into an ExecutionResult"""
+    returncode: int
+    stdout: str
+    stderr: str
+    test_result: Optional[dict] = None  # TestResult fields, when tests were run
+    timed_out: bool = False
+
+
+@dataclass
+class SandboxJob:
+    """Handle for one submit() call, so another thread can cancel it"""
+    worker: Optional[subprocess.Popen] = None  # Set while the task is running on a worker
+    cancelled: bool = False
+
+
+class SandboxPool:
+    """
+    Keeps warm sandbox worker processes alive across attempts.
+
+    Each worker forks a fresh child for every task, so each run is still isolated
+    and resource-limited, but we skip interpreter startup and the wrapper/tempfile
+    round-trip. Up to `size` workers run tasks concurrently; a worker that dies or
+    stops responding is killed and replaced on demand.
+    """
+
+    def __init__(self, size: int = SANDBOX_POOL_SIZE):
+        self.size = max(1, size)
+        self.workers: List[subprocess.Popen] = []
+        self.idle: List[subprocess.Popen] = []  # Most recently used last
+        self.lock = threading.Lock()
+        # Signalled whenever a worker goes idle or a slot frees up
+        self.available = threading.Condition(self.lock)
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def is_supported() -> bool:
+        """The worker relies on fork() and select() on pipes (POSIX only)"""
+        return hasattr(os, "fork") and os.name == "posix"
+
+    def start_worker(self) -> subprocess.Popen:
+        """Start a new worker process"""
+        return subprocess.Popen(
+            [
+                sys.executable, WORKER_PATH, TEST_RUNNER_PATH,
+                str(CPU_TIME_LIMIT), str(MEMORY_LIMIT_MB), str(FILE_SIZE_LIMIT_MB)
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            cwd=LOGS_DIR,  # Restrict filesystem access
+            start_new_session=True,  # Own process group, so a kill takes the task's child with it
+            env={
+                'PATH': os.environ.get('PATH', ''),
+                'PYTHONPATH': '',  # Isolate from system packages
+            }
+        )
+
+    def acquire(self, job: Optional[SandboxJob] = None) -> Optional[subprocess.Popen]:
+        """
+        Take an idle worker, starting a new one if we're below size, else wait for one.
+        The worker is recorded on job; returns None if job is cancelled first.
+        """
+        with self.available:
+            while True:
+                if job is not None and job.cancelled:
+                    return None
+                if self.idle:
+                    worker = self.idle.pop()
+                # Re-checked on every wake-up, since discard() may have freed a slot
+                elif len(self.workers) < self.size:
+                    worker = self.start_worker()
+                    self.workers.append(worker)
+                else:
+                    self.available.wait()
+                    continue
+                if job is not None:
+                    job.worker = worker
+                return worker
+
+    def release(self, worker: subprocess.Popen):
+        """Return a healthy worker to the pool, or discard a dead one"""
+        if worker.poll() is None:
+            with self.available:
+                self.idle.append(worker)
+                self.available.notify()
+        else:
+            self.discard(worker)
+
+    def discard(self, worker: subprocess.Popen):
+        """Kill a worker and forget about it"""
+        with self.available:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            if worker in self.idle:
+                self.idle.remove(worker)
+            self.available.notify()
+        try:
+            # The whole process group, so a task's forked child dies with its worker
+            os.killpg(worker.pid, signal.SIGKILL)
+            worker.wait(timeout=5)
+        except Exception:
+            pass
+
+    def cancel(self, job: SandboxJob):
+        """Stop a submit() from another thread, killing the worker it is running on"""
+        with self.available:
+            job.cancelled = True
+            worker = job.worker
+            self.available.notify_all()  # Wake it if it's still waiting for a worker
+        if worker is not None:
+            self.discard(worker)
+
+    def submit(self, code: str, timeout: int, run_tests: bool = False,
+               job: Optional[SandboxJob] = None) -> SandboxOutcome:
+        """Run code in a fresh child of a warm worker and wait for the outcome. job makes it cancellable."""
+        worker = self.acquire(job)
+        if worker is None:
+            return SandboxOutcome(returncode=-9, stdout="", stderr="Sandbox run cancelled")
+
+        task = json.dumps({"code": code, "timeout": timeout, "run_tests": run_tests})
+        try:
+            worker.stdin.write(task + "\n")
+            worker.stdin.flush()
+
+            ready, _, _ = select.select([worker.stdout], [], [], timeout + WORKER_GRACE_SECONDS)
+            line = worker.stdout.readline() if ready else ""
+        except (BrokenPipeError, OSError, ValueError):
+            line = ""
+
+        cancelled = False
+        if job is not None:
+            with self.lock:
+                # Finished - from here cancel() must not kill a worker we hand back
+                cancelled, job.worker = job.cancelled, None
+
+        if cancelled:
+            self.discard(worker)
+            return SandboxOutcome(returncode=-9, stdout="", stderr="Sandbox run cancelled")
+
+        if not line:
+            # Worker hung or died - replace it so the next attempt starts clean
+            self.discard(worker)
+            return SandboxOutcome(returncode=-9, stdout="", stderr="Sandbox worker stopped responding", timed_out=True)
+
+        self.release(worker)
+        return SandboxOutcome(**json.loads(line))
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        for worker in list(self.workers):
+            self.discard(worker)
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Shared pool for the whole process, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+    return _pool
@@ -0,0 +1,172 @@
+"""
+Warm sandbox worker - started once by SandboxPool and reused for every attempt.
+
+Reads one JSON task per line from stdin ({"code", "timeout", "run_tests"}) and
+forks a fresh child per task, so each run gets a clean namespace and its own
+resource limits without paying interpreter startup again. Uses only the
+standard library, since it runs with an isolated PYTHONPATH.
+
+Usage: python sandbox_worker.py <test_runner_path> <cpu_seconds> <memory_mb> <file_size_mb>
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import select
+import signal
+import traceback
+import importlib.util
+from dataclasses import asdict
+
+# Pre-import what every task needs so forked children start warm
+import unittest
+
+
+def load_test_runner(path: str):
+    """Load src/test_runner.py by path (the src package isn't importable here)"""
+    spec = importlib.util.spec_from_file_location("_sandbox_test_runner", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def apply_resource_limits(cpu_seconds: int, memory_mb: int, file_size_mb: int):
+    """Set CPU, memory and file size limits for the current process"""
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+
+        try:
+            memory_bytes = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        except (ValueError, OSError):
+            # macOS sometimes fails here, that's okay
+            pass
+
+        file_size_bytes = file_size_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_bytes, file_size_bytes))
+
+    except (ImportError, ValueError, OSError):
+        # Resource limits not available on this platform
+        pass
+
+
+def run_child(code: str, run_tests: bool, test_runner, limits: tuple, out_w: int, err_w: int, res_w: int):
+    """Runs in the forked child: execute the code, optionally run its tests, then exit"""
+    exit_code = 0
+    try:
+        # Point stdio at the task's pipes; stdin must not see the task protocol
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        sys.stdin = open(os.devnull)
+
+        apply_resource_limits(*limits)
+
+        # Give the code its own __main__ so unittest.main() finds its tests
+        main_module = types.ModuleType("__main__")
+        main_module.__builtins__ = __builtins__
+        sys.modules["__main__"] = main_module
+        sys.argv = ["<user>"]
+
+        try:
+            exec(compile(code, "<user>", "exec"), main_module.__dict__)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+
+        if run_tests and exit_code == 0:
+            test_result = test_runner.run_tests_in_namespace(main_module.__dict__)
+            os.write(res_w, json.dumps(asdict(test_result)).encode())
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def run_task(task: dict, test_runner, limits: tuple) -> dict:
+    """Fork a child for one task and collect its output, enforcing the wall-clock timeout"""
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    res_r, res_w = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        for fd in (out_r, err_r, res_r):
+            os.close(fd)
+        run_child(task["code"], task["run_tests"], test_runner, limits, out_w, err_w, res_w)
+
+    for fd in (out_w, err_w, res_w):
+        os.close(fd)
+
+    buffers = {out_r: [], err_r: [], res_r: []}
+    open_fds = set(buffers)
+    deadline = time.monotonic() + task["timeout"]
+    timed_out = False
+
+    # Drain all pipes as data arrives so a chatty child can't block on a full pipe
+    while open_fds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            os.kill(pid, signal.SIGKILL)
+            timed_out = True
+            break
+        ready, _, _ = select.select(list(open_fds), [], [], remaining)
+        for fd in ready:
+            chunk = os.read(fd, 65536)
+            if chunk:
+                buffers[fd].append(chunk)
+            else:
+                open_fds.discard(fd)
+
+    _, status = os.waitpid(pid, 0)
+    for fd in buffers:
+        os.close(fd)
+
+    results = b"".join(buffers[res_r])
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout": b"".join(buffers[out_r]).decode("utf-8", errors="replace"),
+        "stderr": b"".join(buffers[err_r]).decode("utf-8", errors="replace"),
+        "test_result": json.loads(results) if results else None,
+        "timed_out": timed_out,
+    }
+
+
+def main():
+    test_runner = load_test_runner(sys.argv[1])
+    limits = tuple(int(arg) for arg in sys.argv[2:5])
+
+    for line in sys.stdin:
+        task = json.loads(line)
+        try:
+            response = run_task(task, test_runner, limits)
+        except Exception as e:
+            response = {
+                "returncode": 1,
+                "stdout": "",
+                "stderr": f"Sandbox worker failed: {e}",
+                "test_result": None,
+                "timed_out": False,
+            }
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
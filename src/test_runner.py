@@ -1,6 +1,5 @@
 import unittest
 import sys
-import io
 from dataclasses import dataclass
 from typing import List
 
@@ -23,24 +22,53 @@ def run_tests(code: str) -> TestResult:
     
     Returns structured results showing which tests passed/failed and why.
     """
-    # Capture stdout/stderr during test execution
-    stdout_capture = io.StringIO()
-    stderr_capture = io.StringIO()
-    
     # Create a namespace to execute the code
     namespace = {}
     
     try:
         # Execute the code to define the test class
         exec(code, namespace)
-        
-        # Find all TestCase classes defined in the code
-        test_classes = [
-            obj for obj in namespace.values()
-            if isinstance(obj, type) and issubclass(obj, unittest.TestCase) and obj != unittest.TestCase
-        ]
-        
-        if not test_classes:
+    except Exception as e:
+        return _execution_error(e)
+    
+    return run_tests_in_namespace(namespace)
+
+
+def run_tests_in_namespace(namespace: dict) -> TestResult:
+    """
+    Runs every unittest.TestCase class found in an already-executed namespace.
+    Used by the sandbox wrapper so tests run in the same process as the code.
+    """
+    try:
+        test_cases = _collect_test_cases(namespace)
+    except Exception as e:
+        return _execution_error(e)
+    
+    return _run_test_cases(test_cases)
+
+
+def _collect_test_cases(namespace: dict) -> tuple:
+    """Find the TestCase classes in a namespace and the test method names on each"""
+    # Find all TestCase classes defined in the code
+    test_classes = [
+        obj for obj in list(namespace.values())
+        if isinstance(obj, type) and issubclass(obj, unittest.TestCase) and obj != unittest.TestCase
+    ]
+    
+    loader = unittest.TestLoader()
+    test_cases = []
+    for test_class in test_classes:
+        names = loader.getTestCaseNames(test_class)
+        if not names and hasattr(test_class, 'runTest'):
+            names = ['runTest']  # Same fallback as TestLoader.loadTestsFromTestCase
+        test_cases.append((test_class, tuple(names)))
+    return tuple(test_cases)
+
+
+def _run_test_cases(test_cases: tuple) -> TestResult:
+    """Run the collected tests and turn the outcome into a TestResult"""
+    try:
+        if not test_cases:
             return TestResult(
                 total_tests=0,
                 passed=0,
@@ -56,35 +84,39 @@ def run_tests(code: str) -> TestResult:
             )
         
         # Create a test suite from all test classes
-        loader = unittest.TestLoader()
-        suite = unittest.TestSuite()
-        for test_class in test_classes:
-            suite.addTests(loader.loadTestsFromTestCase(test_class))
+        suite = unittest.TestSuite(
+            test_class(name) for test_class, names in test_cases for name in names
+        )
         
-        # Run the tests with a custom result object
-        runner = unittest.TextTestRunner(stream=stdout_capture, verbosity=2)
-        result = runner.run(suite)
+        # Run the suite straight into a plain result object - it records failures
+        # and errors without formatting a report nobody reads
+        result = unittest.TestResult()
+        suite.run(result)
         
         # Parse failures and errors
         failures = []
         
+        # Tracebacks can be long - rpartition scans back from the end for the line we want
         for test, traceback in result.failures:
+            # Second-to-last line (the last line is empty, after the trailing newline)
+            head, newline, _ = traceback.rpartition('\n')
             failures.append({
                 'test_name': str(test),
                 'error_type': 'AssertionError',
-                'message': traceback.split('\n')[-2] if '\n' in traceback else traceback,
+                'message': head.rpartition('\n')[2] if newline else traceback,
                 'traceback': traceback
             })
         
         for test, traceback in result.errors:
             # Extract the actual error type from traceback
-            error_lines = traceback.strip().split('\n')
-            error_type = error_lines[-1].split(':')[0] if error_lines else 'Error'
+            last_line = traceback.strip().rpartition('\n')[2]
+            error_type = last_line.partition(':')[0]
             
+            _, newline, tail = traceback.rpartition('\n')
             failures.append({
                 'test_name': str(test),
                 'error_type': error_type,
-                'message': traceback.split('\n')[-1] if '\n' in traceback else traceback,
+                'message': tail if newline else traceback,
                 'traceback': traceback
             })
         
@@ -98,18 +130,22 @@ def run_tests(code: str) -> TestResult:
         )
     
     except Exception as e:
-        # Code failed to execute at all
-        import traceback as tb
-        return TestResult(
-            total_tests=0,
-            passed=0,
-            failed=0,
-            errors=1,
-            failures=[{
-                'test_name': 'code_execution',
-                'error_type': type(e).__name__,
-                'message': str(e),
-                'traceback': tb.format_exc()
-            }],
-            success=False
-        )
\ No newline at end of file
+        return _execution_error(e)
+
+
+def _execution_error(e: Exception) -> TestResult:
+    """Result for code that failed to execute at all"""
+    import traceback as tb
+    return TestResult(
+        total_tests=0,
+        passed=0,
+        failed=0,
+        errors=1,
+        failures=[{
+            'test_name': 'code_execution',
+            'error_type': type(e).__name__,
+            'message': str(e),
+            'traceback': tb.format_exc()
+        }],
+        success=False
+    )